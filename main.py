@@ -1,9 +1,60 @@
+import threading
+import time
+from typing import Dict
+
 import streamlit as st
 
-from mted import load_dataset
-from overall_patterns import page_overall_patterns
-from pairwise_talks import page_pairwise_talks
-from search import page_search
+from mted import MultilingualTalk, load_dataset
+from profiling import Run, count, run, span
+from relation_patterns import schedule_relation_patterns
+from warmup import PRIORITY_DEFAULT, WarmupScheduler, schedule_page_warmup
+
+
+@st.cache(allow_output_mutation=True, hash_funcs={threading.local: lambda _: None})
+def start_warmup() -> WarmupScheduler:
+    """Starts precomputing the results of the Overall Patterns page once per server, shared by all sessions
+
+    `relation_patterns` only computes them, so plotting dependencies are still only imported with the page.
+    """
+    mtalks = load_dataset()
+    scheduler = WarmupScheduler()
+    schedule_relation_patterns(mtalks, scheduler)
+    scheduler.start()
+    return scheduler
+
+
+def warm_up_page(module_name: str, mtalks: Dict[str, MultilingualTalk], scheduler: WarmupScheduler) -> None:
+    """Queues the results of a page that need its own dependencies, e.g. pyvis graphs, once it is first selected"""
+    scheduler.submit(('schedule', module_name), schedule_page_warmup, module_name, mtalks, scheduler,
+                     priority=PRIORITY_DEFAULT)
+
+
+def _show_run_breakdown(profile: Run) -> None:
+    st.table([{
+        'span': row['name'],
+        'calls': row['calls'],
+        'ms': round(row['seconds'] * 1000, 1),
+        'memory delta (KiB)': round(row['memory_delta'] / 1024, 1),
+    } for row in profile.summarize()])
+    st.json(dict(profile.counters))
+
+
+def show_debug_panel(panel, profile: Run, num_pending: int = 0) -> None:
+    """Shows the breakdown of the given run and of the warm-up tasks whose results it used, in a sidebar placeholder;
+    only visible with `?debug=1` in the URL
+    """
+    with panel.container():
+        with st.expander('Debug', expanded=True):
+            if num_pending > 0:
+                elapsed = time.time() - profile.started_at
+                st.write(f'Run: `{profile.name}`, waiting for {num_pending} pending sections after {elapsed * 1000:.1f} ms')
+            else:
+                st.write(f'Last run: `{profile.name}` took {profile.seconds * 1000:.1f} ms')
+            _show_run_breakdown(profile)
+            for task_run in profile.used_runs:
+                st.write(f'Warm-up task `{task_run.name}` took {task_run.seconds * 1000:.1f} ms')
+                _show_run_breakdown(task_run)
+
 
 if __name__ == '__main__':
     st.set_page_config(
@@ -12,15 +63,44 @@ if __name__ == '__main__':
         initial_sidebar_state='expanded',
     )
 
-    mtalks = load_dataset()
+    show_debug = st.experimental_get_query_params().get('debug') == ['1']
 
     st.sidebar.markdown('This is online demo of the paper, "[Visualizing Cross‐Lingual Discourse Relations in Multilingual TED Corpora](https://aclanthology.org/2021.codi-main.16/)" ' +
                         'presented at *[CODI @ EMNLP 2021](https://sites.google.com/view/codi-2021/home)*.')
     st.sidebar.markdown('# Navigation')
     nav_page = st.sidebar.radio('', ('Overall Patterns', 'Pairwise Talks', 'Search'))
-    if nav_page == 'Overall Patterns':
-        page_overall_patterns(mtalks)
-    elif nav_page == 'Pairwise Talks':
-        page_pairwise_talks(mtalks)
-    else:
-        page_search(mtalks)
+
+    debug_panel = st.sidebar.empty()
+    profile = None
+    try:
+        with run(nav_page, enabled=show_debug) as profile:
+            with span('mted.load_dataset'):
+                num_hits = load_dataset.cache_info().hits
+                mtalks = load_dataset()
+                count('cache.load_dataset.hit' if load_dataset.cache_info().hits > num_hits else 'cache.load_dataset.miss')
+            scheduler = start_warmup()
+
+            pending = None
+            if nav_page == 'Overall Patterns':
+                with span('import overall_patterns'):
+                    from overall_patterns import page_overall_patterns
+                pending = page_overall_patterns(mtalks, scheduler)
+            elif nav_page == 'Pairwise Talks':
+                with span('import pairwise_talks'):
+                    from pairwise_talks import page_pairwise_talks
+                warm_up_page('pairwise_talks', mtalks, scheduler)
+                pending = page_pairwise_talks(mtalks, scheduler)
+            else:
+                with span('import search'):
+                    from search import page_search
+                page_search(mtalks)
+
+            # shown before waiting too, as a widget may rerun the page before the pending sections are filled in
+            if show_debug and profile is not None and pending:
+                show_debug_panel(debug_panel, profile, len(pending))
+            if pending:
+                pending.wait()
+    finally:
+        # shown even when the page raised, e.g. while rendering a section that was pending
+        if show_debug and profile is not None:
+            show_debug_panel(debug_panel, profile)
@@ -1,13 +1,19 @@
 import json
 import os
+import re
+from collections import defaultdict
 from copy import deepcopy
+from functools import lru_cache
 from glob import glob
 from itertools import combinations
-from typing import Dict, List, Set, Tuple
+from typing import Any, Dict, Iterator, List, Set, TextIO, Tuple
 
-import streamlit as st
+import numpy as np
+
+import profiling
 
 LANGUAGES = ['Russian', 'Portuguese', 'Polish', 'German', 'English', 'Turkish', 'Lithuanian', 'Chinese']
+DEFAULT_LANG_PAIR = ('English', 'German')
 TALK_IDS = ['talk_1927', 'talk_1971', 'talk_1976', 'talk_1978', 'talk_2009', 'talk_2150']
 
 
@@ -37,17 +43,240 @@ class Sentence:
                 self.inter_annotations_as_arg2.append(annot)
 
 
+class _JSONStream:
+    """Pull parser over a JSON file that is read in chunks
+
+    Objects and arrays are walked key by key and item by item, so that only the values of interest are decoded
+    and the rest are skipped without being built.
+    """
+
+    _WHITESPACE = re.compile(r'[ \t\n\r]*')
+    _STRING = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"', re.DOTALL)
+    _SCALAR_END = re.compile(r'[\s,\]}]')
+    _STRUCTURAL = re.compile(r'["\[\]{}]')
+
+    def __init__(self, f: TextIO, chunk_size: int = 1 << 16):
+        self._f = f
+        self._chunk_size = chunk_size
+        self._decoder = json.JSONDecoder()
+        self._buf = ''
+        self._pos = 0
+        self._eof = False
+
+    def _read_more(self) -> None:
+        """Drops the consumed part of the buffer and appends at least one more chunk"""
+        if self._eof:
+            raise ValueError('Unexpected end of JSON stream')
+        chunk = self._f.read(max(self._chunk_size, len(self._buf) - self._pos))
+        self._buf = self._buf[self._pos:] + chunk
+        self._pos = 0
+        if not chunk:
+            self._eof = True
+
+    def _peek(self) -> str:
+        while True:
+            self._pos = self._WHITESPACE.match(self._buf, self._pos).end()
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            self._read_more()
+
+    def _expect(self, char: str) -> None:
+        if self._peek() != char:
+            raise ValueError(f'Expected {char!r} but found {self._buf[self._pos]!r} in JSON stream')
+        self._pos += 1
+
+    def _next_separator(self, closing: str) -> bool:
+        """Consumes a ',' or the `closing` character, and returns whether there are more items"""
+        char = self._peek()
+        self._pos += 1
+        if char == closing:
+            return False
+        if char != ',':
+            raise ValueError(f'Expected \',\' or {closing!r} but found {char!r} in JSON stream')
+        return True
+
+    def iter_object_keys(self) -> Iterator[str]:
+        """Yields each key of the next object; the caller must consume its value before resuming"""
+        self._expect('{')
+        if self._peek() == '}':
+            self._pos += 1
+            return
+        while True:
+            key = self.decode_value()
+            self._expect(':')
+            yield key
+            if not self._next_separator('}'):
+                return
+
+    def iter_array_items(self) -> Iterator[int]:
+        """Yields the index of each item of the next array; the caller must consume the item before resuming"""
+        self._expect('[')
+        if self._peek() == ']':
+            self._pos += 1
+            return
+        index = 0
+        while True:
+            yield index
+            index += 1
+            if not self._next_separator(']'):
+                return
+
+    def decode_value(self) -> Any:
+        self._peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buf, self._pos)
+            except json.JSONDecodeError:
+                self._read_more()
+                continue
+            # a number at the end of the buffer may continue in the next chunk
+            if end == len(self._buf) and not self._eof:
+                self._read_more()
+                continue
+            self._pos = end
+            return value
+
+    def decode_float32_array(self) -> np.ndarray:
+        """Decodes the next flat array of numbers directly into float32"""
+        self._expect('[')
+        end = self._buf.find(']', self._pos)
+        while end < 0:
+            self._read_more()
+            end = self._buf.find(']', self._pos)
+        values = np.fromstring(self._buf[self._pos:end], dtype=np.float32, sep=',')
+        self._pos = end + 1
+        return values
+
+    def skip_value(self) -> None:
+        char = self._peek()
+        if char == '"':
+            self._skip_string()
+        elif char not in '[{':
+            match = self._SCALAR_END.search(self._buf, self._pos)
+            while match is None and not self._eof:
+                self._read_more()
+                match = self._SCALAR_END.search(self._buf, self._pos)
+            self._pos = match.start() if match is not None else len(self._buf)
+        else:
+            depth = 0
+            while True:
+                match = self._STRUCTURAL.search(self._buf, self._pos)
+                if match is None:
+                    # the rest of the buffer is numbers and separators only
+                    self._pos = len(self._buf)
+                    self._read_more()
+                    continue
+                self._pos = match.start()
+                if match.group() == '"':
+                    self._skip_string()
+                    continue
+                if match.group() == '[' and self._skip_flat_array():
+                    if depth == 0:
+                        return
+                    continue
+                self._pos += 1
+                depth += 1 if match.group() in '[{' else -1
+                if depth == 0:
+                    return
+
+    def _skip_flat_array(self) -> bool:
+        """Skips the array at the current position if it holds no strings or containers, e.g. an embedding
+
+        `str.find` is much faster than a regex search over the thousands of numbers in such an array.
+        """
+        end = self._buf.find(']', self._pos)
+        while end < 0:
+            self._read_more()
+            end = self._buf.find(']', self._pos)
+        for char in '[{"':
+            if self._buf.find(char, self._pos + 1, end) >= 0:
+                return False
+        self._pos = end + 1
+        return True
+
+    def _skip_string(self) -> None:
+        match = self._STRING.match(self._buf, self._pos)
+        while match is None:
+            self._read_more()
+            match = self._STRING.match(self._buf, self._pos)
+        self._pos = match.end()
+
+
+class _Float32Rows:
+    """Preallocated float32 matrix that grows by doubling as rows are appended"""
+
+    def __init__(self, initial_capacity: int = 64):
+        self._initial_capacity = initial_capacity
+        self._rows = None
+        self._num_rows = 0
+
+    def append(self, row: np.ndarray) -> None:
+        if self._rows is None:
+            self._rows = np.empty((self._initial_capacity, len(row)), dtype=np.float32)
+        elif self._num_rows == len(self._rows):
+            grown = np.empty((2 * len(self._rows), self._rows.shape[1]), dtype=np.float32)
+            grown[:self._num_rows] = self._rows
+            self._rows = grown
+        self._rows[self._num_rows] = row
+        self._num_rows += 1
+
+    def to_array(self) -> np.ndarray:
+        if self._rows is None:
+            return np.empty((0, 0), dtype=np.float32)
+        return self._rows[:self._num_rows]
+
+
 class Talk:
-    """A language-specific Talk"""
+    """A language-specific Talk
 
-    def __init__(self, json_path: str):
+    The JSON file is streamed: `raw_text` and the sentence embeddings are skipped without being decoded,
+    unless `load_embeddings` is set, in which case the embeddings are stored in `self.embeddings` as float32
+    arrays of shape (no. of sentences, dim), keyed by model name or `en_translation_embedding`.
+    """
+
+    EMBEDDING_KEYS = ('sentence_embedding_list', 'en_translation_embedding')
+
+    def __init__(self, json_path: str, load_embeddings: bool = False):
+        self.embeddings = None
         with open(json_path, 'r') as f:
-            talk = json.load(f)
+            talk = self._stream_json(f, load_embeddings)
         self.talk_id = talk['talk_id']
         self.language = talk['language']
         self.annotations = talk['annotations']
         self.sentences = self._load_sentences_from_json(talk['sentences'])
 
+    def _stream_json(self, f: TextIO, load_embeddings: bool) -> Dict[str, Any]:
+        stream = _JSONStream(f)
+        embedding_rows = defaultdict(_Float32Rows)
+        talk = {}
+        for key in stream.iter_object_keys():
+            if key == 'sentences':
+                talk['sentences'] = []
+                for _ in stream.iter_array_items():
+                    sentence = {}
+                    for sent_key in stream.iter_object_keys():
+                        if sent_key not in self.EMBEDDING_KEYS:
+                            sentence[sent_key] = stream.decode_value()
+                        elif not load_embeddings:
+                            stream.skip_value()
+                        elif sent_key == 'en_translation_embedding':
+                            embedding_rows[sent_key].append(stream.decode_float32_array())
+                        else:
+                            for model_name in stream.iter_object_keys():
+                                embedding_rows[model_name].append(stream.decode_float32_array())
+                    talk['sentences'].append(sentence)
+            elif key in ('talk_id', 'language', 'annotations'):
+                talk[key] = stream.decode_value()
+            else:
+                stream.skip_value()
+
+        if load_embeddings:
+            self.embeddings = {name: rows.to_array() for name, rows in embedding_rows.items()}
+            for name, embeddings in self.embeddings.items():
+                if len(embeddings) != len(talk['sentences']):
+                    raise ValueError(f'{name} embeddings are missing for some sentences of {talk["talk_id"]}')
+        return talk
+
     def _load_sentences_from_json(self, dict_sentences: List[dict]) -> List[Sentence]:
         sentences = [Sentence(sent, index) for index, sent in enumerate(dict_sentences)]
         for annot in self.annotations:
@@ -72,6 +301,7 @@ class MultilingualTalk:
     def add_talk(self, talk: Talk) -> None:
         self.talks[talk.language] = talk
 
+    @profiling.timed('mted.set_pairwise_alignments')
     def set_pairwise_alignments(self, en_to_xx_alignments: dict) -> None:
         """Sets sentence-level cross-lingual alignments"""
         # set EN-XX alignments
@@ -204,6 +434,7 @@ class MultilingualTalk:
             aligned_relations.append((xx_relations, yy_relations))
         return aligned_relations
 
+    @profiling.timed('mted.get_pairwise_aligned_relation_type_and_senses')
     def get_pairwise_aligned_relation_type_and_senses(self, xx: str, yy: str) -> List[Tuple[Dict, Dict]]:
         def _get_relation_types_and_senses(relations):
             rels_type = []
@@ -239,7 +470,7 @@ class MultilingualTalk:
         return xx_yy_type_sense
 
 
-@st.cache
+@lru_cache(maxsize=None)
 def load_dataset(dataset_dir: str = './dataset') -> Dict[str, MultilingualTalk]:
     talk_alignment_path = os.path.join(dataset_dir, 'cross-lingual_sentence-level_alignments.json')
     with open(talk_alignment_path, 'r') as f:
@@ -251,7 +482,8 @@ def load_dataset(dataset_dir: str = './dataset') -> Dict[str, MultilingualTalk]:
         mtalk = MultilingualTalk(talk_id)
         talk_paths = glob(os.path.join(dataset_dir, talk_id, f'{talk_id}_*.json'))
         for talk_path in talk_paths:
-            mtalk.add_talk(Talk(talk_path))
+            with profiling.span('mted.Talk'):
+                mtalk.add_talk(Talk(talk_path))
         mtalk.set_pairwise_alignments(talk_alignments[talk_id])
         mtalks[talk_id] = mtalk
     return mtalks
@@ -1,5 +1,4 @@
-import itertools
-from collections import Counter, defaultdict
+from collections import defaultdict
 from typing import Dict, List, Tuple
 
 import matplotlib.pyplot as plt
@@ -7,97 +6,16 @@ import numpy as np
 import pandas as pd
 import seaborn as sns
 import streamlit as st
-from apyori import apriori
-
-from mted import LANGUAGES, MultilingualTalk
-
-
-def get_matched_elements(list_a: List[str], list_b: List[str]) -> List[str]:
-    return list((Counter(list_a) & Counter(list_b)).elements())
-
-
-def merge_dict_and_average(all_match_result: List[Dict[str, float]]) -> Dict[str, float]:
-    combined_result = defaultdict(list)
-    for res in all_match_result:
-        for category in res:
-            combined_result[category].append(res[category])
-    combined_result = {cat: np.mean(accs) for cat, accs in combined_result.items()}
-    return combined_result
-
-
-def match_paired_relations_type_sense(paired_relations_type_sense: List[Tuple[Dict, Dict]]) -> Dict[str, float]:
-    """Returns the accuracy scores of matching each relation type and senses
-        E.g. {"type": float,
-              "first": float,
-              "second": float,
-              "first_and_second": float,
-              "all_three": float}
-    """
-    def _calc_relation_matches(xx_type_sense, yy_type_sense):
-        acc_results = {}
-        for category in xx_type_sense.keys():
-            xx_t_s = xx_type_sense[category]
-            yy_t_s = yy_type_sense[category]
-            if len(xx_t_s) == 0 or len(yy_t_s) == 0:
-                continue
-            num_matched = get_matched_elements(xx_t_s, yy_t_s)
-            accuracy = (2 * len(num_matched)) / (len(xx_t_s) + len(yy_t_s))
-            acc_results[category] = accuracy
-        return acc_results
-
-    all_match_result = []
-    for xx_type_sense, yy_type_sense in paired_relations_type_sense:
-        xx_yy_match_result = _calc_relation_matches(xx_type_sense, yy_type_sense)
-        all_match_result.append(xx_yy_match_result)
-    overall_result = merge_dict_and_average(all_match_result)
-    return overall_result
-
-
-def calculate_pairwise_relation_preservation(mtalks: Dict[str, MultilingualTalk], xx: str, yy: str) -> Dict[str, float]:
-    """Calculate the accuracy of matching relations for XX-YY across all talks"""
-    all_matched_result = []
-    for talk in mtalks.values():
-        if xx not in talk.talks or yy not in talk.talks:
-            continue
-        paired_relations_type_sense = talk.get_pairwise_aligned_relation_type_and_senses(xx, yy)
-        matched_result = match_paired_relations_type_sense(paired_relations_type_sense)
-        all_matched_result.append(matched_result)
-    all_matched_result = merge_dict_and_average(all_matched_result)
-    return all_matched_result
-
-
-def mine_association_rules(mtalks: Dict[str, MultilingualTalk], xx: str, yy: str):
-    def _print_rules(rules, filter_identity=True):
-        _rules = []
-        for record in rules:
-            for ordered_stat in record.ordered_statistics:
-                _rules.append((ordered_stat.lift, ordered_stat.confidence, ordered_stat.items_base, ordered_stat.items_add))
-        _rules = sorted(_rules, reverse=True)
-        for lift, confidence, items_base, items_add in _rules:
-            items_base = list(items_base)
-            items_add = list(items_add)
-            if len(items_base) == 0 or len(items_add) == 0:
-                continue
-            if filter_identity and len(items_base) == len(items_add):
-                base_senses = set([sense.split('-', 1)[1] for sense in items_base])
-                add_senses = set([sense.split('-', 1)[1] for sense in items_add])
-                if base_senses == add_senses:
-                    continue
-            if lift > 1.0:
-                st.write(f'Rule: {items_base} -> {items_add}, Confidence: {confidence:.3f}, Lift: {lift:.3f}')
-
-    transactions_first = []
-    for talk in mtalks.values():
-        if xx not in talk.talks or yy not in talk.talks:
-            continue
-        paired_relations_type_sense = talk.get_pairwise_aligned_relation_type_and_senses(xx, yy)
-        for xx_type_sense, yy_type_sense in paired_relations_type_sense:
-            xx_first = [f'{xx}-{r}' for r in xx_type_sense['first'] if r != 'N/A']
-            yy_first = [f'{yy}-{r}' for r in yy_type_sense['first'] if r != 'N/A']
-            if len(xx_first) > 0 and len(yy_first) > 0:
-                transactions_first.append([*xx_first, *yy_first])
-
-    results_first = list(apriori(transactions_first))
+
+from mted import DEFAULT_LANG_PAIR, LANGUAGES, MultilingualTalk
+from profiling import timed
+from relation_patterns import (HEATMAP_CATEGORY_NAMES, calculate_all_pairwise_relation_preservation,
+                               find_relation_translation_pattern, get_pairwise_relation_preservation_comparisons,
+                               get_pairwise_relation_preservation_intervals, mine_association_rules)
+from warmup import PendingSections, WarmupScheduler
+
+
+def render_association_rules(rules: List[Tuple[float, float, List[str], List[str]]]) -> None:
     st.header('Association Rules')
     st.markdown('Both $confidence$ and $lift$ are two useful concepts in *association rule learning* that select interesting rules from the set of all possible rules.')
     st.markdown('$Confidence$ value (ranging from 0 to 1) of a rule $X → Y$ represents the proportion of transactions that contains $X$ which also contains $Y$.\n' +
@@ -106,10 +24,12 @@ def mine_association_rules(mtalks: Dict[str, MultilingualTalk], xx: str, yy: str
     st.markdown('$Lift$ value of a rule greater than 1.0 means that $X$ and $Y$ are statistically dependent and therefore, potentially a useful rule.')
     st.markdown('Below, we show association rules that are "non-identical" and have lift score greater than 1.0.')
     st.markdown('---')
-    _print_rules(results_first)
+    for lift, confidence, items_base, items_add in rules:
+        st.write(f'Rule: {items_base} -> {items_add}, Confidence: {confidence:.3f}, Lift: {lift:.3f}')
 
 
-def find_relation_translation_pattern(mtalks: Dict[str, MultilingualTalk], xx: str, yy: str):
+@timed('overall_patterns.render_relation_translation_pattern')
+def render_relation_translation_pattern(patterns_xx2yy: Dict, patterns_yy2xx: Dict, xx: str, yy: str) -> None:
     def draw_two_pie_charts(data1, data2, main_title, data1_title, data2_title):
         fig = plt.figure(figsize=(22, 10))
         fig.suptitle(main_title)
@@ -123,32 +43,6 @@ def find_relation_translation_pattern(mtalks: Dict[str, MultilingualTalk], xx: s
 
     st.header('Pie Charts for Relation Divergence')
     st.write('When drawing the following pie charts, we only considered aligned XX-YY pairs that have the same number of relations.')
-    all_paired_relations = []
-    for talk in mtalks.values():
-        if xx not in talk.talks or yy not in talk.talks:
-            continue
-        paired_relations_type_sense = talk.get_pairwise_aligned_relation_type_and_senses(xx, yy)
-        all_paired_relations.extend(paired_relations_type_sense)
-
-    patterns_xx2yy = defaultdict(lambda: defaultdict(Counter))
-    patterns_yy2xx = defaultdict(lambda: defaultdict(Counter))
-    for xx_rels, yy_rels in all_paired_relations:
-        if len(xx_rels) <= 0 or len(yy_rels) <= 0:
-            continue
-        # we only consider xx-yy pairs that have the same no. of relations
-        if len(xx_rels['type']) != len(yy_rels['type']):
-            continue
-
-        for xx_r, yy_r in zip(xx_rels['type'], yy_rels['type']):
-            patterns_xx2yy['relation_type'][xx_r][yy_r] += 1
-            patterns_yy2xx['relation_type'][yy_r][xx_r] += 1
-        for xx_r, yy_r in zip(xx_rels['first'], yy_rels['first']):
-            patterns_xx2yy['first_sense'][xx_r][yy_r] += 1
-            patterns_yy2xx['first_sense'][yy_r][xx_r] += 1
-        for xx_r, yy_r in zip(xx_rels['first_and_second'], yy_rels['first_and_second']):
-            patterns_xx2yy['first_and_second_sense'][xx_r][yy_r] += 1
-            patterns_yy2xx['first_and_second_sense'][yy_r][xx_r] += 1
-
     for pattern in patterns_xx2yy.keys():
         with st.expander(pattern):
             rels_dict_xx2yy = patterns_xx2yy[pattern]
@@ -161,27 +55,54 @@ def find_relation_translation_pattern(mtalks: Dict[str, MultilingualTalk], xx: s
                     st.markdown('''---''')
 
 
-def page_overall_patterns(mtalks: Dict[str, MultilingualTalk]) -> None:
-    def _print_heatmap(langpair_to_scores):
+def render_pairwise_relation_preservation_comparisons(comparisons: List[Dict], xx: str, yy: str) -> None:
+    st.header('Significance of Differences')
+    st.write(f'Differences between the overall accuracies of {xx}-{yy} and those of every other language pair, ' +
+             'with the two-sided p-values of permutation tests that exchange aligned pairs between the two within each talk.')
+    rows = defaultdict(dict)
+    for comparison in comparisons:
+        other_xx, other_yy = comparison['pair']
+        category_name = HEATMAP_CATEGORY_NAMES[comparison['category']]
+        rows[f'{other_xx}-{other_yy}'][category_name] = f"{comparison['difference']:+.3f} (p={comparison['p_value']:.3f})"
+    with st.expander(f'{xx}-{yy} vs. other language pairs'):
+        st.table(pd.DataFrame.from_dict(rows, orient='index'))
+
+
+def page_overall_patterns(mtalks: Dict[str, MultilingualTalk], scheduler: WarmupScheduler) -> PendingSections:
+    """Renders the page, and returns the sections still being computed for the caller to wait on"""
+    @timed('overall_patterns.print_heatmap')
+    def _print_heatmap(langpair_to_scores, langpair_to_intervals=None):
         rows = []
+        labels = []
         cols_inds = []
         for xx in LANGUAGES:
             acc_strs = []
+            acc_labels = []
             cols_inds.extend(['', '', xx])
             for yy in LANGUAGES:
                 if xx == yy:
                     acc_strs.extend([1.0, 1.0, 1.0])
-                else:
-                    try:
-                        acc_str = langpair_to_scores[(xx, yy)]
-                    except KeyError:
-                        acc_str = langpair_to_scores[(yy, xx)]
-                    acc_strs.extend(acc_str)
+                    acc_labels.extend(['1', '1', '1'])
+                    continue
+                try:
+                    acc_str = langpair_to_scores[(xx, yy)]
+                except KeyError:
+                    acc_str = langpair_to_scores[(yy, xx)]
+                acc_strs.extend(acc_str)
+                if langpair_to_intervals is not None:
+                    intervals = langpair_to_intervals.get((xx, yy)) or langpair_to_intervals[(yy, xx)]
+                    for acc, (lower, upper) in zip(acc_str, intervals):
+                        acc_labels.append(f'{acc:.2g}' if np.isnan(lower) else f'{acc:.2g}\n[{lower:.2g}, {upper:.2g}]')
             rows.append(acc_strs)
+            labels.append(acc_labels)
         df = pd.DataFrame(rows, columns=cols_inds, index=LANGUAGES)
         sns.set(font_scale=1)
-        fig, ax = plt.subplots(figsize=(12,6))
-        ax = sns.heatmap(df, annot=True, cmap='coolwarm_r', vmin=0, vmax=1, cbar=False)
+        if langpair_to_intervals is None:
+            fig, ax = plt.subplots(figsize=(12,6))
+            ax = sns.heatmap(df, annot=True, cmap='coolwarm_r', vmin=0, vmax=1, cbar=False)
+        else:
+            fig, ax = plt.subplots(figsize=(18,9))
+            ax = sns.heatmap(df, annot=np.array(labels), fmt='', annot_kws={'size': 8}, cmap='coolwarm_r', vmin=0, vmax=1, cbar=False)
         ax.hlines(list(range(len(LANGUAGES)+1)), *ax.get_xlim(), colors='black')
         ax.vlines([3 * i for i in range(len(LANGUAGES)+1)], *ax.get_ylim(), colors='black')
         st.pyplot(fig)
@@ -191,19 +112,51 @@ def page_overall_patterns(mtalks: Dict[str, MultilingualTalk]) -> None:
              'For each language pair, each cell represents, from left-to-right, ' +
              'the accuracy of matching `relation_type`; `first_sense`; `first_sense` and `second_sense` (joint).')
 
-    langpair_to_scores = {}
-    for xx, yy in itertools.combinations(LANGUAGES, 2):
-        scores = calculate_pairwise_relation_preservation(mtalks, xx, yy)
-        langpair_to_scores[(xx, yy)] = [scores['type'], scores['first'], scores['first_and_second']]
-    _print_heatmap(langpair_to_scores)
+    show_intervals = st.checkbox('Annotate 95% bootstrap confidence intervals, resampling aligned pairs within each talk')
+
+    pending = PendingSections(scheduler)
+    langpair_to_scores = scheduler.get(('heatmap',), calculate_all_pairwise_relation_preservation, mtalks)
+    if show_intervals:
+        langpair_to_intervals = scheduler.get(('intervals',), get_pairwise_relation_preservation_intervals, mtalks, scheduler)
+        if langpair_to_scores is None or langpair_to_intervals is None:
+            pending.add([('heatmap',), ('intervals',)], 'Bootstrapping confidence intervals..', _print_heatmap)
+        else:
+            _print_heatmap(langpair_to_scores, langpair_to_intervals)
+    elif langpair_to_scores is None:
+        pending.add([('heatmap',)], 'Calculating overall accuracies..', _print_heatmap)
+    else:
+        _print_heatmap(langpair_to_scores)
 
     col1, col2 = st.columns(2)
     with col1:
-        sel_xx = st.selectbox('Select 1st language', LANGUAGES, index=LANGUAGES.index('English'))
+        sel_xx = st.selectbox('Select 1st language', LANGUAGES, index=LANGUAGES.index(DEFAULT_LANG_PAIR[0]))
     with col2:
-        sel_yy = st.selectbox('Select 2nd language', LANGUAGES, index=LANGUAGES.index('German'))
+        sel_yy = st.selectbox('Select 2nd language', LANGUAGES, index=LANGUAGES.index(DEFAULT_LANG_PAIR[1]))
     if sel_xx == sel_yy:
         st.write('First and second langs must be different!')
     else:
-        mine_association_rules(mtalks, sel_xx, sel_yy)
-        find_relation_translation_pattern(mtalks, sel_xx, sel_yy)
+        # accuracies are symmetric, so the comparisons are kept once per unordered pair
+        pair = tuple(sorted((sel_xx, sel_yy), key=LANGUAGES.index))
+
+        def _render_comparisons(langpair_to_comparisons):
+            render_pairwise_relation_preservation_comparisons(langpair_to_comparisons[pair], sel_xx, sel_yy)
+
+        def _render_patterns(patterns):
+            render_relation_translation_pattern(*patterns, sel_xx, sel_yy)
+
+        langpair_to_comparisons = scheduler.get(('comparisons',), get_pairwise_relation_preservation_comparisons, mtalks, scheduler)
+        if langpair_to_comparisons is None:
+            pending.add([('comparisons',)], 'Running permutation tests..', _render_comparisons)
+        else:
+            _render_comparisons(langpair_to_comparisons)
+        rules = scheduler.get(('rules', sel_xx, sel_yy), mine_association_rules, mtalks, sel_xx, sel_yy)
+        if rules is None:
+            pending.add([('rules', sel_xx, sel_yy)], 'Mining association rules..', render_association_rules)
+        else:
+            render_association_rules(rules)
+        patterns = scheduler.get(('patterns', sel_xx, sel_yy), find_relation_translation_pattern, mtalks, sel_xx, sel_yy)
+        if patterns is None:
+            pending.add([('patterns', sel_xx, sel_yy)], 'Counting relation divergences..', _render_patterns)
+        else:
+            _render_patterns(patterns)
+    return pending
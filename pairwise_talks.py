@@ -6,7 +6,9 @@ import streamlit as st
 import streamlit.components.v1 as components
 from pyvis.network import Network
 
-from mted import MultilingualTalk, Sentence
+from mted import DEFAULT_LANG_PAIR, MultilingualTalk, Sentence
+from profiling import count, span, timed
+from warmup import PRIORITY_BACKGROUND, PRIORITY_DEFAULT, PendingSections, WarmupScheduler
 
 
 def _format_sentence_for_node(sentence: str) -> str:
@@ -26,15 +28,25 @@ def _format_intra_node(whole_sentence: str, arg1_part: str, arg2_part: str, rel_
     return whole_sentence
 
 
+@timed('pairwise_talks.render_streamlit_component')
 def _render_streamlit_component(component_path: str, width_pixels: int, height_pixels: int) -> None:
     with open(component_path, 'r', encoding='utf-8') as f:
         source_code = f.read()
     components.html(source_code, width=width_pixels, height=height_pixels)
 
 
-def render_interactive_graph_network(mtalk: MultilingualTalk, xx: str, yy: str, show_en_trans: bool = False,
-                                     width_pixels: int = 1700, height_pixels: int = 1500,
-                                     rendering_dir: str = './renderings', use_cache: bool = False) -> None:
+def get_default_sentence_index_bounds(mtalk: MultilingualTalk, xx: str, yy: str) -> Tuple[int, int]:
+    """Returns the initial (lower, upper) values of the sentence alignment sliders"""
+    num_alignments = len(mtalk.pairwise_alignments[(xx, yy)])
+    return 0, min(40, num_alignments)
+
+
+@timed('pairwise_talks.build_interactive_graph_network')
+def build_interactive_graph_network(mtalk: MultilingualTalk, xx: str, yy: str,
+                                    lb_sent_index: int, ub_sent_index: int, show_en_trans: bool = False,
+                                    width_pixels: int = 1700, height_pixels: int = 1500,
+                                    rendering_dir: str = './renderings', use_cache: bool = False) -> str:
+    """Writes the pyvis graph of XX-YY alignments within the given bounds and returns the path to its html"""
 
     def _add_paired_nodes_and_crosslingaul_relations(xx_inds: List[int], yy_inds: List[int],
                                                      xx_width_pos: int, yy_width_pos: int) -> Tuple[int, int]:
@@ -98,14 +110,12 @@ def render_interactive_graph_network(mtalk: MultilingualTalk, xx: str, yy: str,
     pairwise_relations = mtalk.get_pairwise_aligned_relations(xx, yy)
     assert len(pairwise_indices) == len(pairwise_relations)
 
-    # use sliders to limit the number of paired relations to render
-    col1, col2 = st.columns(2)
-    with col1:
-        lb_sent_index = st.slider('Lower-bound for sentence alignments index:', 0, len(pairwise_indices), 0)
-    with col2:
-        ub_sent_index = st.slider('Upper-bound for sentence alignments index:', 0, len(pairwise_indices), min(40, len(pairwise_indices)))
-
-    output_graph_path = os.path.join(rendering_dir, f'{mtalk.talk_id}_{xx}-{yy}_{lb_sent_index}-{ub_sent_index}.html')
+    # every variant of the graph gets its own file, as the paths of built graphs are kept by the warm-up scheduler
+    trans_suffix = '_en' if show_en_trans else ''
+    output_graph_path = os.path.join(rendering_dir, f'{mtalk.talk_id}_{xx}-{yy}_{lb_sent_index}-{ub_sent_index}' +
+                                     f'{trans_suffix}_{width_pixels}x{height_pixels}.html')
+    if use_cache:
+        count('cache.renderings.hit' if os.path.isfile(output_graph_path) else 'cache.renderings.miss')
     if not use_cache or not os.path.isfile(output_graph_path):
         G = Network(width_pixels, height_pixels, layout=False, directed=True)
         pairwise_indices = pairwise_indices[lb_sent_index:ub_sent_index + 1]
@@ -123,30 +133,76 @@ def render_interactive_graph_network(mtalk: MultilingualTalk, xx: str, yy: str,
         for node_id in G.get_nodes():
             G.get_node(node_id)['title'] = _format_sentence_for_node(G.get_node(node_id)['title'])
 
-        if not os.path.isdir(rendering_dir):
-            os.makedirs(rendering_dir)
+        os.makedirs(rendering_dir, exist_ok=True)
         G.set_edge_smooth('dynamic')
-        G.show(output_graph_path)
+        with span('pyvis.show'):
+            G.show(output_graph_path)
+    return output_graph_path
+
+
+def _graph_key(mtalk: MultilingualTalk, xx: str, yy: str, show_en_trans: bool,
+               lb_sent_index: int, ub_sent_index: int, width_pixels: int = 1700, height_pixels: int = 1500) -> Tuple:
+    return ('graph', mtalk.talk_id, xx, yy, show_en_trans, lb_sent_index, ub_sent_index, width_pixels, height_pixels)
 
-    st.write('When graph network is not visible, click on any point in the empty box and drag it to upper-left direction a few times.')
-    st.write('You can also zoom-in and zoom-out on the graph, and click on the nodes and edges.')
-    _render_streamlit_component(output_graph_path, width_pixels, height_pixels)
+
+def schedule_pairwise_talks(mtalks: Dict[str, MultilingualTalk], scheduler: WarmupScheduler) -> None:
+    """Queues the graphs shown by default for every talk, the first talk ahead of the others"""
+    xx, yy = DEFAULT_LANG_PAIR
+    for talk_index, mtalk in enumerate(mtalks.values()):
+        if xx not in mtalk.talks or yy not in mtalk.talks:
+            continue
+        priority = PRIORITY_DEFAULT if talk_index == 0 else PRIORITY_BACKGROUND
+        lb_sent_index, ub_sent_index = get_default_sentence_index_bounds(mtalk, xx, yy)
+        scheduler.submit(_graph_key(mtalk, xx, yy, False, lb_sent_index, ub_sent_index),
+                         build_interactive_graph_network, mtalk, xx, yy, lb_sent_index, ub_sent_index, False,
+                         priority=priority)
+
+
+def render_interactive_graph_network(mtalk: MultilingualTalk, xx: str, yy: str, scheduler: WarmupScheduler,
+                                     pending: PendingSections, show_en_trans: bool = False,
+                                     width_pixels: int = 1700, height_pixels: int = 1500) -> None:
+    """Renders the XX-YY graph, or adds it to `pending` while it is being built"""
+    num_alignments = len(mtalk.pairwise_alignments[(xx, yy)])
+    default_lb, default_ub = get_default_sentence_index_bounds(mtalk, xx, yy)
+
+    # use sliders to limit the number of paired relations to render
+    col1, col2 = st.columns(2)
+    with col1:
+        lb_sent_index = st.slider('Lower-bound for sentence alignments index:', 0, num_alignments, default_lb)
+    with col2:
+        ub_sent_index = st.slider('Upper-bound for sentence alignments index:', 0, num_alignments, default_ub)
+
+    def _render_graph(output_graph_path):
+        st.write('When graph network is not visible, click on any point in the empty box and drag it to upper-left direction a few times.')
+        st.write('You can also zoom-in and zoom-out on the graph, and click on the nodes and edges.')
+        _render_streamlit_component(output_graph_path, width_pixels, height_pixels)
+
+    graph_key = _graph_key(mtalk, xx, yy, show_en_trans, lb_sent_index, ub_sent_index, width_pixels, height_pixels)
+    output_graph_path = scheduler.get(graph_key, build_interactive_graph_network,
+                                      mtalk, xx, yy, lb_sent_index, ub_sent_index, show_en_trans, width_pixels, height_pixels)
+    if output_graph_path is None:
+        pending.add([graph_key], 'Building graph network..', _render_graph)
+    else:
+        _render_graph(output_graph_path)
 
 
-def page_pairwise_talks(mtalks: Dict[str, MultilingualTalk]) -> None:
+def page_pairwise_talks(mtalks: Dict[str, MultilingualTalk], scheduler: WarmupScheduler) -> PendingSections:
+    """Renders the page, and returns the sections still being computed for the caller to wait on"""
+    pending = PendingSections(scheduler)
     st.header('Interactive Graph Network for Pairwise Talks')
     sel_talk_id = st.selectbox('Select Talk ID', list(mtalks.keys()), index=0)
     sel_talk = mtalks[sel_talk_id]
     languages = sel_talk.get_all_langs()
     col1, col2, col3 = st.columns(3)
     with col1:
-        sel_xx = st.selectbox('Select 1st language', languages, index=languages.index('English'))
+        sel_xx = st.selectbox('Select 1st language', languages, index=languages.index(DEFAULT_LANG_PAIR[0]))
     with col2:
-        sel_yy = st.selectbox('Select 2nd language', languages, index=languages.index('German'))
+        sel_yy = st.selectbox('Select 2nd language', languages, index=languages.index(DEFAULT_LANG_PAIR[1]))
     with col3:
         show_en_trans = st.selectbox('Show English translations instead', ['Yes', 'No'], index=1)
     if sel_xx == sel_yy:
         st.write('First and second langs must be different!')
     else:
         show_en_trans = True if show_en_trans == 'Yes' else False
-        render_interactive_graph_network(sel_talk, sel_xx, sel_yy, show_en_trans)
+        render_interactive_graph_network(sel_talk, sel_xx, sel_yy, scheduler, pending, show_en_trans)
+    return pending
@@ -0,0 +1,183 @@
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional
+
+# set VIZ_MTED_PROFILE=1 to instrument every run; VIZ_MTED_PROFILE_JSONL=<path> to also export them
+PROFILE_ENV = 'VIZ_MTED_PROFILE'
+PROFILE_JSONL_ENV = 'VIZ_MTED_PROFILE_JSONL'
+
+_enabled = False
+_local = threading.local()
+_export_lock = threading.Lock()
+_tracing_lock = threading.Lock()
+_num_tracing_runs = 0
+_owns_tracing = False
+
+
+class Run:
+    """Timing spans and counters recorded during one script run or warm-up task
+
+    Memory deltas come from `tracemalloc`, which traces the whole process,
+    so they also include allocations made by other threads in the meantime; they are 0 while it is off.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.started_at = time.time()
+        self.seconds = 0.0
+        self.spans = []
+        self.counters = Counter()
+        # runs of the warm-up tasks whose results were used, e.g. by a page
+        self.used_runs = []
+        self._depth = 0
+
+    def summarize(self) -> List[Dict]:
+        """Aggregates spans by name, in order of their first appearance"""
+        summary = {}
+        for sp in self.spans:
+            row = summary.setdefault(sp['name'], {'name': sp['name'], 'calls': 0, 'seconds': 0.0, 'memory_delta': 0})
+            row['calls'] += 1
+            row['seconds'] += sp['seconds']
+            row['memory_delta'] += sp['memory_delta']
+        return list(summary.values())
+
+    def to_dict(self) -> Dict:
+        return {
+            'name': self.name,
+            'started_at': self.started_at,
+            'seconds': self.seconds,
+            'spans': self.spans,
+            'counters': dict(self.counters),
+            'used_runs': [used_run.name for used_run in self.used_runs],
+        }
+
+
+def enable() -> None:
+    """Profiles every run of the process, warm-up tasks included; done on import when VIZ_MTED_PROFILE is set"""
+    global _enabled
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+    _enabled = True
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def current_run() -> Optional[Run]:
+    return getattr(_local, 'run', None)
+
+
+def _acquire_tracing() -> None:
+    """Starts tracing memory for a run, unless it is traced already"""
+    global _num_tracing_runs, _owns_tracing
+    with _tracing_lock:
+        if _num_tracing_runs == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _owns_tracing = True
+        _num_tracing_runs += 1
+
+
+def _release_tracing() -> None:
+    """Stops tracing memory once the last run that started it has finished"""
+    global _num_tracing_runs, _owns_tracing
+    with _tracing_lock:
+        _num_tracing_runs -= 1
+        if _num_tracing_runs == 0 and _owns_tracing:
+            tracemalloc.stop()
+            _owns_tracing = False
+
+
+@contextmanager
+def run(name: str, enabled: bool = False, trace_memory: bool = True) -> Iterator[Optional[Run]]:
+    """Records the spans of the enclosed code in a new `Run`; yields None when profiling is off
+
+    Only the calling thread is profiled when `enabled` is given, e.g. for the script run of a `?debug=1` session;
+    all runs are profiled once `enable()` was called.
+    Without `trace_memory`, only timings and counters are recorded unless memory is traced already.
+    """
+    if not (_enabled or enabled) or current_run() is not None:
+        yield None
+        return
+    new_run = Run(name)
+    _local.run = new_run
+    if trace_memory:
+        _acquire_tracing()
+    started = time.perf_counter()
+    try:
+        yield new_run
+    finally:
+        new_run.seconds = time.perf_counter() - started
+        _local.run = None
+        if trace_memory:
+            _release_tracing()
+        jsonl_path = os.environ.get(PROFILE_JSONL_ENV)
+        if jsonl_path:
+            export_jsonl(new_run, jsonl_path)
+
+
+@contextmanager
+def span(name: str) -> Iterator[None]:
+    cur_run = current_run()
+    if cur_run is None:
+        yield
+        return
+    # appended before running, so that spans are listed in the order they were entered
+    record = {'name': name, 'depth': cur_run._depth, 'seconds': 0.0, 'memory_delta': 0}
+    cur_run.spans.append(record)
+    cur_run._depth += 1
+    memory_before = tracemalloc.get_traced_memory()[0]
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record['seconds'] = time.perf_counter() - started
+        record['memory_delta'] = tracemalloc.get_traced_memory()[0] - memory_before
+        cur_run._depth -= 1
+
+
+def timed(name: str) -> Callable:
+    """Decorator version of `span`"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if current_run() is None:
+                return func(*args, **kwargs)
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def count(name: str, n: int = 1) -> None:
+    cur_run = current_run()
+    if cur_run is not None:
+        cur_run.counters[name] += n
+
+
+def use_run(used_run: Optional[Run]) -> None:
+    """Lists a finished run, e.g. of the warm-up task whose result is used, under the current run"""
+    cur_run = current_run()
+    if cur_run is not None and used_run is not None and used_run not in cur_run.used_runs:
+        cur_run.used_runs.append(used_run)
+
+
+def export_jsonl(run_to_export: Run, jsonl_path: str) -> None:
+    """Appends the run as a single JSON line"""
+    line = json.dumps(run_to_export.to_dict())
+    with _export_lock:
+        dir_path = os.path.dirname(jsonl_path)
+        if dir_path and not os.path.isdir(dir_path):
+            os.makedirs(dir_path)
+        with open(jsonl_path, 'a') as f:
+            f.write(line + '\n')
+
+
+if os.environ.get(PROFILE_ENV, '0') not in ('', '0'):
+    enable()
@@ -0,0 +1,246 @@
+import itertools
+from collections import Counter, defaultdict
+from typing import Dict, List, Tuple
+
+import numpy as np
+from apyori import apriori
+
+from mted import DEFAULT_LANG_PAIR, LANGUAGES, MultilingualTalk
+from profiling import span, timed
+from resampling import bootstrap_hierarchical_means, permutation_test_hierarchical_means
+from warmup import PRIORITY_BACKGROUND, PRIORITY_DEFAULT, WarmupScheduler
+
+# categories of the three cells shown for each language pair in the heatmap, from left to right
+HEATMAP_CATEGORIES = ['type', 'first', 'first_and_second']
+HEATMAP_CATEGORY_NAMES = {'type': 'relation_type', 'first': 'first_sense', 'first_and_second': 'first_sense and second_sense'}
+
+
+def get_matched_elements(list_a: List[str], list_b: List[str]) -> List[str]:
+    return list((Counter(list_a) & Counter(list_b)).elements())
+
+
+def merge_dict_and_average(all_match_result: List[Dict[str, float]]) -> Dict[str, float]:
+    combined_result = defaultdict(list)
+    for res in all_match_result:
+        for category in res:
+            combined_result[category].append(res[category])
+    combined_result = {cat: np.mean(accs) for cat, accs in combined_result.items()}
+    return combined_result
+
+
+def calc_relation_matches(xx_type_sense: Dict, yy_type_sense: Dict) -> Dict[str, float]:
+    """Returns the accuracy scores of matching each relation type and senses of an aligned XX-YY group"""
+    acc_results = {}
+    for category in xx_type_sense.keys():
+        xx_t_s = xx_type_sense[category]
+        yy_t_s = yy_type_sense[category]
+        if len(xx_t_s) == 0 or len(yy_t_s) == 0:
+            continue
+        num_matched = get_matched_elements(xx_t_s, yy_t_s)
+        accuracy = (2 * len(num_matched)) / (len(xx_t_s) + len(yy_t_s))
+        acc_results[category] = accuracy
+    return acc_results
+
+
+def match_paired_relations_type_sense(paired_relations_type_sense: List[Tuple[Dict, Dict]]) -> Dict[str, float]:
+    """Returns the accuracy scores of matching each relation type and senses
+        E.g. {"type": float,
+              "first": float,
+              "second": float,
+              "first_and_second": float,
+              "all_three": float}
+    """
+    all_match_result = []
+    for xx_type_sense, yy_type_sense in paired_relations_type_sense:
+        xx_yy_match_result = calc_relation_matches(xx_type_sense, yy_type_sense)
+        all_match_result.append(xx_yy_match_result)
+    overall_result = merge_dict_and_average(all_match_result)
+    return overall_result
+
+
+def calculate_pairwise_relation_preservation(mtalks: Dict[str, MultilingualTalk], xx: str, yy: str) -> Dict[str, float]:
+    """Calculate the accuracy of matching relations for XX-YY across all talks"""
+    all_matched_result = []
+    for talk in mtalks.values():
+        if xx not in talk.talks or yy not in talk.talks:
+            continue
+        paired_relations_type_sense = talk.get_pairwise_aligned_relation_type_and_senses(xx, yy)
+        matched_result = match_paired_relations_type_sense(paired_relations_type_sense)
+        all_matched_result.append(matched_result)
+    all_matched_result = merge_dict_and_average(all_matched_result)
+    return all_matched_result
+
+
+def collect_group_scores(mtalks: Dict[str, MultilingualTalk], xx: str, yy: str) -> Dict[str, Dict[str, List[float]]]:
+    """Returns the accuracy scores of every aligned XX-YY group, by category and then by talk
+        E.g. {"type": {"talk_1971": [float, ..], "talk_2009": [float, ..]}, ..}
+    """
+    group_scores = defaultdict(lambda: defaultdict(list))
+    for talk_id, talk in mtalks.items():
+        if xx not in talk.talks or yy not in talk.talks:
+            continue
+        for xx_type_sense, yy_type_sense in talk.get_pairwise_aligned_relation_type_and_senses(xx, yy):
+            for category, accuracy in calc_relation_matches(xx_type_sense, yy_type_sense).items():
+                group_scores[category][talk_id].append(accuracy)
+    return group_scores
+
+
+@timed('relation_patterns.calculate_all_pairwise_relation_preservation')
+def calculate_all_pairwise_relation_preservation(mtalks: Dict[str, MultilingualTalk]) -> Dict[Tuple[str, str], List[float]]:
+    """Returns the heatmap scores, [type, first, first_and_second], for every language pair"""
+    langpair_to_scores = {}
+    for xx, yy in itertools.combinations(LANGUAGES, 2):
+        scores = calculate_pairwise_relation_preservation(mtalks, xx, yy)
+        langpair_to_scores[(xx, yy)] = [scores[category] for category in HEATMAP_CATEGORIES]
+    return langpair_to_scores
+
+
+@timed('relation_patterns.collect_all_group_scores')
+def collect_all_group_scores(mtalks: Dict[str, MultilingualTalk]) -> Dict[Tuple[str, str], Dict[str, Dict[str, List[float]]]]:
+    """Returns the group scores of every language pair, see `collect_group_scores`"""
+    return {(xx, yy): collect_group_scores(mtalks, xx, yy) for xx, yy in itertools.combinations(LANGUAGES, 2)}
+
+
+@timed('relation_patterns.bootstrap_all_pairwise_relation_preservation')
+def bootstrap_all_pairwise_relation_preservation(langpair_to_group_scores: Dict[Tuple[str, str], Dict[str, Dict[str, List[float]]]],
+                                                 num_resamples: int = 2000,
+                                                 alpha: float = 0.05) -> Dict[Tuple[str, str], List[Tuple[float, float]]]:
+    """Returns the (lower, upper) bootstrap confidence intervals of the heatmap scores for every language pair"""
+    units = []
+    unit_keys = []
+    for (xx, yy), group_scores in langpair_to_group_scores.items():
+        for category in HEATMAP_CATEGORIES:
+            if len(group_scores[category]) > 0:
+                units.append(list(group_scores[category].values()))
+                unit_keys.append((xx, yy, category))
+    _, lower, upper = bootstrap_hierarchical_means(units, num_resamples=num_resamples, alpha=alpha)
+
+    intervals = {(xx, yy, category): (lo, up) for (xx, yy, category), lo, up in zip(unit_keys, lower, upper)}
+    return {(xx, yy): [intervals.get((xx, yy, category), (np.nan, np.nan)) for category in HEATMAP_CATEGORIES]
+            for xx, yy in langpair_to_group_scores}
+
+
+@timed('relation_patterns.compare_all_pairwise_relation_preservation')
+def compare_all_pairwise_relation_preservation(langpair_to_group_scores: Dict[Tuple[str, str], Dict[str, Dict[str, List[float]]]],
+                                               num_permutations: int = 2000) -> Dict[Tuple[str, str], List[Dict]]:
+    """Permutation-tests the heatmap scores of every language pair against those of every other, in one pass
+        E.g. {("English", "German"): [{"pair": ("German", "Polish"), "category": "type", "difference": float, "p_value": float}, ..], ..}
+    """
+    comparisons = []
+    comparison_keys = []
+    # a test of A against B is also one of B against A, so each couple of language pairs is tested once
+    for pair_a, pair_b in itertools.combinations(langpair_to_group_scores, 2):
+        for category in HEATMAP_CATEGORIES:
+            scores_a = langpair_to_group_scores[pair_a][category]
+            scores_b = langpair_to_group_scores[pair_b][category]
+            if len(scores_a) == 0 or len(scores_b) == 0:
+                continue
+            talk_ids = list(dict.fromkeys([*scores_a, *scores_b]))
+            comparisons.append([(scores_a.get(talk_id, []), scores_b.get(talk_id, [])) for talk_id in talk_ids])
+            comparison_keys.append((pair_a, pair_b, category))
+    differences, p_values = permutation_test_hierarchical_means(comparisons, num_permutations=num_permutations)
+
+    langpair_to_comparisons = {pair: [] for pair in langpair_to_group_scores}
+    for (pair_a, pair_b, category), difference, p_value in zip(comparison_keys, differences, p_values):
+        langpair_to_comparisons[pair_a].append({'pair': pair_b, 'category': category, 'difference': difference, 'p_value': p_value})
+        langpair_to_comparisons[pair_b].append({'pair': pair_a, 'category': category, 'difference': -difference, 'p_value': p_value})
+    return langpair_to_comparisons
+
+
+def get_all_group_scores(mtalks: Dict[str, MultilingualTalk],
+                         scheduler: WarmupScheduler) -> Dict[Tuple[str, str], Dict[str, Dict[str, List[float]]]]:
+    """Returns the group scores of every language pair, collected once and shared by the tasks that resample them"""
+    return scheduler.compute(('group_scores',), collect_all_group_scores, mtalks)
+
+
+def get_pairwise_relation_preservation_intervals(mtalks: Dict[str, MultilingualTalk],
+                                                 scheduler: WarmupScheduler) -> Dict[Tuple[str, str], List[Tuple[float, float]]]:
+    return bootstrap_all_pairwise_relation_preservation(get_all_group_scores(mtalks, scheduler))
+
+
+def get_pairwise_relation_preservation_comparisons(mtalks: Dict[str, MultilingualTalk],
+                                                   scheduler: WarmupScheduler) -> Dict[Tuple[str, str], List[Dict]]:
+    return compare_all_pairwise_relation_preservation(get_all_group_scores(mtalks, scheduler))
+
+
+@timed('relation_patterns.mine_association_rules')
+def mine_association_rules(mtalks: Dict[str, MultilingualTalk], xx: str, yy: str,
+                           filter_identity: bool = True) -> List[Tuple[float, float, List[str], List[str]]]:
+    """Returns non-identical (lift, confidence, items_base, items_add) rules with lift > 1.0, sorted by lift"""
+    transactions_first = []
+    for talk in mtalks.values():
+        if xx not in talk.talks or yy not in talk.talks:
+            continue
+        paired_relations_type_sense = talk.get_pairwise_aligned_relation_type_and_senses(xx, yy)
+        for xx_type_sense, yy_type_sense in paired_relations_type_sense:
+            xx_first = [f'{xx}-{r}' for r in xx_type_sense['first'] if r != 'N/A']
+            yy_first = [f'{yy}-{r}' for r in yy_type_sense['first'] if r != 'N/A']
+            if len(xx_first) > 0 and len(yy_first) > 0:
+                transactions_first.append([*xx_first, *yy_first])
+
+    _rules = []
+    with span('relation_patterns.apriori'):
+        for record in apriori(transactions_first):
+            for ordered_stat in record.ordered_statistics:
+                _rules.append((ordered_stat.lift, ordered_stat.confidence, ordered_stat.items_base, ordered_stat.items_add))
+    _rules = sorted(_rules, reverse=True)
+    rules = []
+    for lift, confidence, items_base, items_add in _rules:
+        items_base = list(items_base)
+        items_add = list(items_add)
+        if len(items_base) == 0 or len(items_add) == 0:
+            continue
+        if filter_identity and len(items_base) == len(items_add):
+            base_senses = set([sense.split('-', 1)[1] for sense in items_base])
+            add_senses = set([sense.split('-', 1)[1] for sense in items_add])
+            if base_senses == add_senses:
+                continue
+        if lift > 1.0:
+            rules.append((lift, confidence, items_base, items_add))
+    return rules
+
+
+@timed('relation_patterns.find_relation_translation_pattern')
+def find_relation_translation_pattern(mtalks: Dict[str, MultilingualTalk], xx: str, yy: str) -> Tuple[Dict, Dict]:
+    """Returns XX->YY and YY->XX divergence counters, keyed by pattern and then by source relation
+        E.g. ({"relation_type": {"Explicit": Counter({"Explicit": 10, "Implicit": 2}), ..}, ..}, {..})
+    """
+    all_paired_relations = []
+    for talk in mtalks.values():
+        if xx not in talk.talks or yy not in talk.talks:
+            continue
+        paired_relations_type_sense = talk.get_pairwise_aligned_relation_type_and_senses(xx, yy)
+        all_paired_relations.extend(paired_relations_type_sense)
+
+    patterns_xx2yy = defaultdict(lambda: defaultdict(Counter))
+    patterns_yy2xx = defaultdict(lambda: defaultdict(Counter))
+    for xx_rels, yy_rels in all_paired_relations:
+        if len(xx_rels) <= 0 or len(yy_rels) <= 0:
+            continue
+        # we only consider xx-yy pairs that have the same no. of relations
+        if len(xx_rels['type']) != len(yy_rels['type']):
+            continue
+
+        for xx_r, yy_r in zip(xx_rels['type'], yy_rels['type']):
+            patterns_xx2yy['relation_type'][xx_r][yy_r] += 1
+            patterns_yy2xx['relation_type'][yy_r][xx_r] += 1
+        for xx_r, yy_r in zip(xx_rels['first'], yy_rels['first']):
+            patterns_xx2yy['first_sense'][xx_r][yy_r] += 1
+            patterns_yy2xx['first_sense'][yy_r][xx_r] += 1
+        for xx_r, yy_r in zip(xx_rels['first_and_second'], yy_rels['first_and_second']):
+            patterns_xx2yy['first_and_second_sense'][xx_r][yy_r] += 1
+            patterns_yy2xx['first_and_second_sense'][yy_r][xx_r] += 1
+    return patterns_xx2yy, patterns_yy2xx
+
+
+def schedule_relation_patterns(mtalks: Dict[str, MultilingualTalk], scheduler: WarmupScheduler) -> None:
+    """Queues the results of the Overall Patterns page for every language pair, the default pair ahead of the others"""
+    scheduler.submit(('heatmap',), calculate_all_pairwise_relation_preservation, mtalks, priority=PRIORITY_DEFAULT)
+    scheduler.submit(('intervals',), get_pairwise_relation_preservation_intervals, mtalks, scheduler,
+                     priority=PRIORITY_DEFAULT)
+    scheduler.submit(('comparisons',), get_pairwise_relation_preservation_comparisons, mtalks, scheduler,
+                     priority=PRIORITY_DEFAULT)
+    for xx, yy in itertools.permutations(LANGUAGES, 2):
+        priority = PRIORITY_DEFAULT if (xx, yy) == DEFAULT_LANG_PAIR else PRIORITY_BACKGROUND
+        scheduler.submit(('rules', xx, yy), mine_association_rules, mtalks, xx, yy, priority=priority)
+        scheduler.submit(('patterns', xx, yy), find_relation_translation_pattern, mtalks, xx, yy, priority=priority)
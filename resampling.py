@@ -0,0 +1,121 @@
+from typing import List, Sequence, Tuple
+
+import numpy as np
+
+
+def _encode_scores(scores: List[float]) -> Tuple[np.ndarray, np.ndarray]:
+    """Returns int32 codes of the scores into the table of their distinct values"""
+    table, codes = np.unique(np.asarray(scores, dtype=np.float64), return_inverse=True)
+    return codes.astype(np.int32).ravel(), table
+
+
+def _segment_starts(sizes: np.ndarray) -> np.ndarray:
+    return np.concatenate([[0], np.cumsum(sizes)[:-1]]).astype(np.int64)
+
+
+def bootstrap_hierarchical_means(units: List[List[Sequence[float]]], num_resamples: int = 2000, alpha: float = 0.05,
+                                 seed: int = 0, chunk_size: int = 500) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Returns the means of every unit and their (1 - alpha) percentile bootstrap intervals, as (means, lower, upper)
+
+    `units[u][s]` holds the group scores of stratum `s` (e.g. a talk) of unit `u` (e.g. a language pair and category);
+    neither strata nor units may be empty. A unit's mean is taken over groups per stratum, and then over strata.
+    Every resample redraws groups with replacement within each stratum, for all units in one pass;
+    resamples are drawn `chunk_size` at a time to bound memory.
+    """
+    if len(units) == 0:
+        return np.empty(0), np.empty(0), np.empty(0)
+    codes, table = _encode_scores([score for strata in units for scores in strata for score in scores])
+    strata_sizes = np.array([len(scores) for strata in units for scores in strata], dtype=np.int64)
+    unit_num_strata = np.array([len(strata) for strata in units], dtype=np.int64)
+    strata_starts = _segment_starts(strata_sizes)
+    unit_starts = _segment_starts(unit_num_strata)
+
+    def _hierarchical_means(values):
+        strata_means = np.add.reduceat(values, strata_starts, axis=1) / strata_sizes
+        return np.add.reduceat(strata_means, unit_starts, axis=1) / unit_num_strata
+
+    # each group is redrawn from the groups of its own stratum
+    group_strata = np.repeat(np.arange(len(strata_sizes)), strata_sizes)
+    group_starts = strata_starts[group_strata]
+    group_sizes = strata_sizes[group_strata]
+
+    rng = np.random.default_rng(seed)
+    estimates = np.empty((num_resamples, len(units)))
+    for begin in range(0, num_resamples, chunk_size):
+        end = min(begin + chunk_size, num_resamples)
+        draws = group_starts + (rng.random((end - begin, len(codes))) * group_sizes).astype(np.int64)
+        estimates[begin:end] = _hierarchical_means(table[codes[draws]])
+
+    means = _hierarchical_means(table[codes][np.newaxis])[0]
+    lower, upper = np.percentile(estimates, [100 * alpha / 2, 100 * (1 - alpha / 2)], axis=0)
+    return means, lower, upper
+
+
+def permutation_test_hierarchical_means(comparisons: List[List[Tuple[Sequence[float], Sequence[float]]]],
+                                        num_permutations: int = 2000, seed: int = 0,
+                                        chunk_size: int = 100) -> Tuple[np.ndarray, np.ndarray]:
+    """Returns the differences of hierarchical means, A - B, of every comparison and their two-sided p-values
+
+    `comparisons[c][s]` holds the (A, B) group scores of stratum `s` (e.g. a talk) of comparison `c`;
+    one side of a stratum may be empty, but each side must have groups in at least one stratum.
+    Under the null hypothesis, groups are exchangeable between A and B within a stratum,
+    so every permutation redraws which of the pooled groups of each stratum are A's, for all comparisons in one pass.
+    """
+    if len(comparisons) == 0:
+        return np.empty(0), np.empty(0)
+    codes, table = _encode_scores([score for strata in comparisons for scores_a, scores_b in strata
+                                   for score in [*scores_a, *scores_b]])
+    a_sizes = np.array([len(scores_a) for strata in comparisons for scores_a, _ in strata], dtype=np.int64)
+    b_sizes = np.array([len(scores_b) for strata in comparisons for _, scores_b in strata], dtype=np.int64)
+    strata_sizes = a_sizes + b_sizes
+    num_strata = len(strata_sizes)
+    strata_starts = _segment_starts(strata_sizes)
+    comparison_starts = _segment_starts(np.array([len(strata) for strata in comparisons], dtype=np.int64))
+    comparison_num_a_strata = np.add.reduceat((a_sizes > 0).astype(np.int64), comparison_starts)
+    comparison_num_b_strata = np.add.reduceat((b_sizes > 0).astype(np.int64), comparison_starts)
+
+    # within each stratum, the first `a_size` positions are A and the rest are B
+    group_strata = np.repeat(np.arange(num_strata), strata_sizes)
+    group_positions = np.arange(len(codes)) - strata_starts[group_strata]
+    is_a = group_positions < a_sizes[group_strata]
+    values = table[codes]
+    strata_sums = np.bincount(group_strata, weights=values, minlength=num_strata)
+
+    # strata are laid out largest first, so that those with a group at a given position are a prefix
+    strata_order = np.argsort(-strata_sizes, kind='stable')
+    strata_ranks = np.empty(num_strata, dtype=np.int64)
+    strata_ranks[strata_order] = np.arange(num_strata)
+    sorted_sizes = strata_sizes[strata_order]
+    sorted_a_sizes = a_sizes[strata_order].astype(np.float32)
+    width = sorted_sizes[0] if num_strata > 0 else 0
+    sorted_values = np.zeros((num_strata, width))
+    sorted_values[strata_ranks[group_strata], group_positions] = values
+    num_strata_at = [int((sorted_sizes > position).sum()) for position in range(width)]
+
+    def _differences(a_sums):
+        b_sums = strata_sums - a_sums
+        strata_means_a = np.divide(a_sums, a_sizes, out=np.zeros_like(a_sums), where=a_sizes > 0)
+        strata_means_b = np.divide(b_sums, b_sizes, out=np.zeros_like(b_sums), where=b_sizes > 0)
+        means_a = np.add.reduceat(strata_means_a, comparison_starts, axis=1) / comparison_num_a_strata
+        means_b = np.add.reduceat(strata_means_b, comparison_starts, axis=1) / comparison_num_b_strata
+        return means_a - means_b
+
+    observed = _differences(np.bincount(group_strata, weights=values * is_a, minlength=num_strata)[np.newaxis])[0]
+    rng = np.random.default_rng(seed)
+    num_extreme = np.zeros(len(comparisons), dtype=np.int64)
+    for begin in range(0, num_permutations, chunk_size):
+        end = min(begin + chunk_size, num_permutations)
+        # strata by permutations; uniforms and counts are float32 for speed, the sums stay exact float64
+        sorted_a_sums = np.zeros((num_strata, end - begin))
+        num_a_left = np.tile(sorted_a_sizes[:, np.newaxis], (1, end - begin))
+        # selection sampling: each group is A's with probability (A's groups left) / (groups left)
+        for position, k in enumerate(num_strata_at):
+            uniforms = rng.random((k, end - begin), dtype=np.float32)
+            uniforms *= (sorted_sizes[:k] - position).astype(np.float32)[:, np.newaxis]
+            is_drawn = uniforms < num_a_left[:k]
+            sorted_a_sums[:k] += is_drawn * sorted_values[:k, position, np.newaxis]
+            num_a_left[:k] -= is_drawn
+        permuted = _differences(sorted_a_sums[strata_ranks].T)
+        num_extreme += (np.abs(permuted) >= np.abs(observed) - 1e-12).sum(axis=0)
+    p_values = (num_extreme + 1) / (num_permutations + 1)
+    return observed, p_values
@@ -5,10 +5,12 @@ import streamlit as st
 import streamlit.components.v1 as components
 from pyvis.network import Network
 
-from mted import LANGUAGES, MultilingualTalk, Sentence
+from mted import LANGUAGES, MultilingualTalk, Sentence, Talk
 from pairwise_talks import _format_intra_node, _format_sentence_for_node, _render_streamlit_component
+from profiling import count, span, timed
 
 
+@timed('search.render_result_network_graph')
 def _render_result_network_graph(result: Dict,
                                  width_pixels: int = 1000, height_pixels: int = 1000,
                                  rendering_dir: str = './renderings', use_cache: bool = False) -> None:
@@ -45,6 +47,8 @@ def _render_result_network_graph(result: Dict,
     curr_sent_index = result['sent_index']
 
     output_graph_path = os.path.join(rendering_dir, f'{xx}_{talk_id}_{curr_sent_index}_{query}.html')
+    if use_cache:
+        count('cache.renderings.hit' if os.path.isfile(output_graph_path) else 'cache.renderings.miss')
     if not use_cache or not os.path.isfile(output_graph_path):
         before_sentence = result['before_sentence']
         curr_sentence = result['sentence']
@@ -59,10 +63,10 @@ def _render_result_network_graph(result: Dict,
         for node_id in G.get_nodes():
             G.get_node(node_id)['title'] = _format_sentence_for_node(G.get_node(node_id)['title'])
 
-        if not os.path.isdir(rendering_dir):
-            os.makedirs(rendering_dir)
+        os.makedirs(rendering_dir, exist_ok=True)
         G.set_edge_smooth('dynamic')
-        G.show(output_graph_path)
+        with span('pyvis.show'):
+            G.show(output_graph_path)
         _render_streamlit_component(output_graph_path, width_pixels, height_pixels)
 
 
@@ -77,6 +81,27 @@ def _render_found_results(results: List[Dict], query: str) -> None:
             _render_result_network_graph(res)
 
 
+@timed('search.find_sentences')
+def find_sentences(talks: List[Talk], query: str) -> List[Dict]:
+    found = []
+    for talk in talks:
+        for sent_index, sent_instance in enumerate(talk.sentences):
+            if query in sent_instance.sentence:
+                assert sent_index == sent_instance.sentence_index
+                before_sentence = talk.sentences[sent_index - 1] if sent_index > 0 else None
+                after_sentence = talk.sentences[sent_index + 1] if sent_index < len(talk.sentences) - 1 else None
+                result = {
+                    'talk_id': talk.talk_id,
+                    'sent_index': sent_index,
+                    'language': talk.language,
+                    'before_sentence': before_sentence,
+                    'sentence': sent_instance,
+                    'after_sentence': after_sentence
+                }
+                found.append(result)
+    return found
+
+
 def page_search(mtalks: Dict[str, MultilingualTalk]) -> None:
     col1, col2 = st.columns(2)
     with col1:
@@ -91,22 +116,8 @@ def page_search(mtalks: Dict[str, MultilingualTalk]) -> None:
 
     query = query.strip()
     if len(query) > 0:
-        found = []
-        for talk in talks:
-            for sent_index, sent_instance in enumerate(talk.sentences):
-                if query in sent_instance.sentence:
-                    assert sent_index == sent_instance.sentence_index
-                    before_sentence = talk.sentences[sent_index - 1] if sent_index > 0 else None
-                    after_sentence = talk.sentences[sent_index + 1] if sent_index < len(talk.sentences) - 1 else None
-                    result = {
-                        'talk_id': talk.talk_id,
-                        'sent_index': sent_index,
-                        'language': talk.language,
-                        'before_sentence': before_sentence,
-                        'sentence': sent_instance,
-                        'after_sentence': after_sentence
-                    }
-                    found.append(result)
+        found = find_sentences(talks, query)
+        count('search.results', len(found))
         if len(found) > 0:
             _render_found_results(found, query)
         else:
@@ -0,0 +1,204 @@
+import importlib
+import itertools
+import queue
+import threading
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+import streamlit as st
+
+from profiling import count, run, use_run
+
+PRIORITY_URGENT = 0
+PRIORITY_DEFAULT = 1
+PRIORITY_BACKGROUND = 2
+
+
+class WarmupScheduler:
+    """Precomputes page results on background threads and keeps them for every session of the server
+
+    Tasks are identified by hashable keys and run in order of priority (lower first), then of submission.
+    Results are kept for the life of the process, like the dataset loaded by `mted.load_dataset`,
+    so restart the server after changing the dataset.
+    """
+
+    def __init__(self, num_workers: int = 2):
+        self.num_workers = num_workers
+        self._queue = queue.PriorityQueue()
+        self._order = itertools.count()
+        self._lock = threading.Lock()
+        self._finished = threading.Condition(self._lock)
+        self._tasks = {}
+        self._running = set()
+        self._results = {}
+        self._errors = {}
+        self._runs = {}
+        self._workers = []
+
+    def start(self) -> None:
+        for _ in range(self.num_workers - len(self._workers)):
+            worker = threading.Thread(target=self._work, daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def submit(self, key: Hashable, func: Callable, *args, priority: int = PRIORITY_BACKGROUND) -> None:
+        """Queues `func(*args)` under `key`; re-submitting a queued key only raises its priority"""
+        with self._lock:
+            if key in self._running or key in self._results or key in self._errors:
+                return
+            if key in self._tasks and self._tasks[key][2] <= priority:
+                return
+            # the entry queued before, if any, is skipped by the workers once this one is taken
+            order = next(self._order)
+            self._tasks[key] = (func, args, priority, order)
+            self._queue.put((priority, order, key))
+
+    def get(self, key: Hashable, func: Optional[Callable] = None, *args) -> Optional[Any]:
+        """Returns the result for `key`, or None if it is not ready yet
+
+        When `func` is given and the result is not being computed, it is queued ahead of all warm-up tasks.
+        An exception raised by the task is re-raised here once, so that the next call retries it.
+        """
+        with self._lock:
+            if key in self._results:
+                count('cache.warmup.hit')
+                use_run(self._runs.get(key))
+                return self._results[key]
+            if key in self._errors:
+                raise self._errors.pop(key)
+            is_running = key in self._running
+        count('cache.warmup.miss')
+        if func is not None and not is_running:
+            self.submit(key, func, *args, priority=PRIORITY_URGENT)
+        return None
+
+    def compute(self, key: Hashable, func: Callable, *args) -> Any:
+        """Returns the result for `key`, computing it on the calling thread unless another thread already is
+
+        For tasks that share the result of another, without tying up a worker while that one is still queued.
+        """
+        with self._lock:
+            self._finished.wait_for(lambda: key not in self._running)
+            if key not in self._results and key not in self._errors:
+                # its queued entry, if any, is skipped by the workers from now on
+                self._tasks.pop(key, None)
+                self._running.add(key)
+                is_computing = True
+            else:
+                is_computing = False
+        if is_computing:
+            self._run(key, func, args)
+        with self._lock:
+            if key in self._errors:
+                raise self._errors[key]
+            return self._results[key]
+
+    def is_finished(self, key: Hashable) -> bool:
+        with self._lock:
+            return key in self._results or key in self._errors
+
+    def wait(self, keys: List[Hashable], timeout: float) -> bool:
+        """Blocks until any of `keys` is finished or `timeout` seconds have passed; returns whether one is"""
+        with self._lock:
+            return self._finished.wait_for(
+                lambda: any(key in self._results or key in self._errors for key in keys), timeout)
+
+    def status(self, key: Hashable) -> Tuple[str, int]:
+        """Returns the state of the task for `key`, with the no. of queued tasks ahead of it if it is queued
+            E.g. ("queued", 12), ("running", 0), ("finished", 0) or ("unknown", 0)
+        """
+        with self._lock:
+            if key in self._results or key in self._errors:
+                return 'finished', 0
+            if key in self._running:
+                return 'running', 0
+            if key in self._tasks:
+                position = self._tasks[key][2:]
+                return 'queued', sum(1 for task in self._tasks.values() if task[2:] < position)
+            return 'unknown', 0
+
+    def _work(self) -> None:
+        while True:
+            _, order, key = self._queue.get()
+            with self._lock:
+                # stale entry of a task that was re-submitted with a higher priority
+                if key not in self._tasks or self._tasks[key][3] != order:
+                    continue
+                func, args, _, _ = self._tasks.pop(key)
+                self._running.add(key)
+            self._run(key, func, args)
+
+    def _run(self, key: Hashable, func: Callable, args: Tuple) -> None:
+        # timings are always recorded, cheaply, so that a `?debug=1` session can show the tasks of its results
+        task_run = None
+        try:
+            with run(f'warmup {key}', enabled=True, trace_memory=False) as task_run:
+                result = func(*args)
+        except Exception as e:
+            with self._lock:
+                self._running.discard(key)
+                self._errors[key] = e
+                self._runs[key] = task_run
+                self._finished.notify_all()
+        else:
+            with self._lock:
+                self._running.discard(key)
+                self._results[key] = result
+                self._runs[key] = task_run
+                self._finished.notify_all()
+
+
+def schedule_page_warmup(module_name: str, mtalks: Dict, scheduler: WarmupScheduler) -> None:
+    """Imports a page module and queues its warm-up tasks through its `schedule_<module_name>` function
+
+    Submitted as a task itself, so that the page's heavy dependencies are imported off the script thread.
+    """
+    module = importlib.import_module(module_name)
+    getattr(module, f'schedule_{module_name}')(mtalks, scheduler)
+
+
+def show_warmup_progress(scheduler: WarmupScheduler, keys: List[Hashable], message: str) -> None:
+    """Shows how far the tasks of the awaited `keys` are, rather than the whole warm-up queue"""
+    statuses = [scheduler.status(key) for key in keys]
+    st.info(message)
+    st.progress(sum(1 for state, _ in statuses if state == 'finished') / len(keys))
+    for key, (state, num_ahead) in zip(keys, statuses):
+        name = ' '.join(str(part) for part in key)
+        if state == 'queued':
+            st.caption(f'`{name}`: queued, {num_ahead} tasks ahead of it.')
+        else:
+            st.caption(f'`{name}`: {state}.')
+
+
+class PendingSections:
+    """Sections of a page whose results are still being computed, shown as placeholders until they are ready"""
+
+    def __init__(self, scheduler: WarmupScheduler):
+        self.scheduler = scheduler
+        self._sections = []
+
+    def __len__(self) -> int:
+        return len(self._sections)
+
+    def add(self, keys: List[Hashable], message: str, render: Callable[..., None]) -> None:
+        """Shows the progress of `keys` in a placeholder, to be replaced by `render(*results)` once all are ready"""
+        placeholder = st.empty()
+        with placeholder.container():
+            show_warmup_progress(self.scheduler, keys, message)
+        self._sections.append((keys, message, render, placeholder))
+
+    def wait(self, poll_interval: float = 0.5) -> None:
+        """Fills in the sections as their results become ready, without rerunning the page
+
+        A rerun triggered by a widget in the meantime stops the wait at the next progress update.
+        """
+        while len(self._sections) > 0:
+            self.scheduler.wait([key for keys, _, _, _ in self._sections for key in keys], poll_interval)
+            still_pending = []
+            for keys, message, render, placeholder in self._sections:
+                with placeholder.container():
+                    if all(self.scheduler.is_finished(key) for key in keys):
+                        render(*[self.scheduler.get(key) for key in keys])
+                    else:
+                        show_warmup_progress(self.scheduler, keys, message)
+                        still_pending.append((keys, message, render, placeholder))
+            self._sections = still_pending